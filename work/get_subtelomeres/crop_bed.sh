@@ -53,13 +53,6 @@ while getopts "n:s:e:" o; do
     esac
 done
 
-cat "$file" | while read line; do
-    chrom="`echo "$line" | cut -f1`"
-    chrom_start="`echo "$line" | cut -f2`"
-    chrom_end="`echo "$line" | cut -f3`"
-    if [ -n "`echo $chrom | egrep "$start$"`" ]; then
-        echo -e "$chrom\t$chrom_start\t$(($chrom_start + $len))"
-    else
-        echo -e "$chrom\t$(($chrom_end - $len))\t$chrom_end"
-    fi
-done
+scriptdir=$(dirname $0)
+
+python3 $scriptdir/subtelo_bed.py crop "$file" -n "$len" -s "$start" -e "$end"
@@ -80,7 +80,7 @@ while getopts "n:b:c:t:o:xf:B:d" o; do
             subtelo_buffer=$OPTARG
             ;;
         c)
-            chrom_cout=$OPTARG
+            chrom_count=$OPTARG
             ;;
         t)
             temp_dir=$OPTARG
@@ -118,7 +118,7 @@ if [ $extract_subtelomere ]; then
 
     echo "Generating file for chromosome extraction"
     # Extract 500Kb + buffer as bed file
-    ./$scriptdir/subtelomeres_bed.sh $temp_dir/chrom.sizes -o $temp_dir/seq_ends.bed -n $(( $subtelo_len + $subtelo_buffer )) -c $chrom_count
+    ./$scriptdir/subtelo_bed.py ends $temp_dir/chrom.sizes -o $temp_dir/seq_ends.bed -n $(( $subtelo_len + $subtelo_buffer )) -c $chrom_count
 
     echo "Extracting sequences close to ends of chromosomes"
     # Seqkit subseq for sequence ends
@@ -135,12 +135,13 @@ $seqtk telo $temp_dir/seq_ends.fa > $temp_dir/telo.bed 2> /dev/null
 
 # Invert to get subtelomeric sequences
 # use bedtools to subtract $temp_dir/telo.bed from full sequences
-./$scriptdir/full_bed.sh $temp_dir/seq_ends.fa > $temp_dir/seq_ends.full.bed
+seqkit faidx $temp_dir/seq_ends.fa
+./$scriptdir/subtelo_bed.py full $temp_dir/seq_ends.fa.fai -o $temp_dir/seq_ends.full.bed
 bedtools subtract -a $temp_dir/seq_ends.full.bed -b $temp_dir/telo.bed > $temp_dir/subtelo.bed
 
 echo "Cropping subtelomeric sequences to exact size"
 # Choose subsequence to only span 500Kb
-./$scriptdir/crop_bed.sh $temp_dir/subtelo.bed -n $subtelo_len > $temp_dir/subtelo_cropped.bed
+./$scriptdir/subtelo_bed.py crop $temp_dir/subtelo.bed -n $subtelo_len -o $temp_dir/subtelo_cropped.bed
 
 seqkit subseq --quiet --bed $temp_dir/subtelo_cropped.bed $temp_dir/seq_ends.fa |\
 sed "s/_[^_]*$//" > $temp_dir/subtelo_cropped.fa
@@ -7,8 +7,4 @@ file=$1
 
 faSize -detailed $file > ${file%.*}.sizes
 
-cat ${file%.*}.sizes | while read seq; do
-    id="`echo "$seq" | cut -f1`"
-    length="`echo "$seq" | cut -f2`"
-    echo -e "$id\t0\t$length"
-done
+python3 $(dirname $0)/subtelo_bed.py full ${file%.*}.sizes
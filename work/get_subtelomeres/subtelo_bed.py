@@ -0,0 +1,145 @@
+#!/bin/python3.11
+
+import argparse
+from sys import stdout
+
+
+HELP="""
+Generates and crops BED files used for extraction of subtelomeres.
+
+Replaces crop_bed.sh, subtelomeres_bed.sh and full_bed.sh. All of the operations
+process whole files at once instead of forking per line, so they scale with
+the number of assemblies processed.
+
+Usage: subtelo_bed crop bed_file [-n len] [-s start] [-e end] [-o output]
+       subtelo_bed ends sizes_file [-n len] [-c count] [-s] [-o output]
+       subtelo_bed full sizes_or_fai_file [-o output]
+
+Commands:
+crop    Crops sequences given by BED file to some length
+        The cropping is given by the end of chromosome field of BED file.
+        Features on '..._START' sequence keep their start,
+        all other features keep their end.
+ends    Extracts subtelomere regions as BED file from chromosome.sizes file
+        Only first/largest count sequences are taken into account.
+full    Generates BED file spanning whole sequences of sizes or .fai file
+
+The functions in this file may also be imported and used as a library,
+each of them works on lists of lines or features.
+"""
+
+
+def read_lines(file):
+    """
+    Reads whole file at once and returns its nonempty lines split by tabs.
+    """
+    with open(file, 'r') as f:
+        return [line.split("\t") for line in f.read().split("\n") if line]
+
+
+def read_sizes(file):
+    """
+    Reads chromosome.sizes (faSize -detailed) or .fai file into list
+    of (sequence, length). Only first two columns are used.
+    """
+    return [(line[0], int(line[1])) for line in read_lines(file)]
+
+
+def format_bed(features):
+    return "".join("\t".join(map(str, feature)) + "\n" for feature in features)
+
+
+def write_bed(features, output=None):
+    """
+    Writes features into file output, or to stdout when output is None.
+    """
+    if output is None:
+        stdout.write(format_bed(features))
+        return
+    with open(output, 'w') as f:
+        f.write(format_bed(features))
+
+
+def crop_bed(features, length=500000, start='_START', end='_END'):
+    """
+    Crops each feature to length bases.
+
+    Features on sequences whose name ends with start keep their start
+    coordinate, others keep their end coordinate.
+    The end suffix is kept for compatibility with crop_bed.sh.
+    """
+    cropped = []
+    for feature in features:
+        chrom, chrom_start, chrom_end = feature[0], int(feature[1]), int(feature[2])
+        if chrom.endswith(start):
+            cropped.append([chrom, chrom_start, chrom_start + length])
+        else:
+            cropped.append([chrom, chrom_end - length, chrom_end])
+    return cropped
+
+
+def ends_bed(sizes, length=500000, count=24, sort=False):
+    """
+    Creates features spanning length bases at the start and at the end
+    of first count sequences. Features are named <sequence>_START
+    and <sequence>_END.
+
+    If sort is set, sequences are sorted by length (longest first)
+    before count is applied.
+    """
+    if sort:
+        sizes = sorted(sizes, key=lambda x: x[1], reverse=True)
+    features = []
+    for chrom, size in sizes[:count]:
+        features.append([chrom, 0, min(length, size), f"{chrom}_START"])
+        features.append([chrom, max(0, size - length), size, f"{chrom}_END"])
+    return features
+
+
+def full_bed(sizes):
+    """
+    Creates features spanning whole sequences.
+    """
+    return [[chrom, 0, size] for chrom, size in sizes]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='subtelo_bed',
+        description=HELP,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    crop = commands.add_parser('crop', help='Crop features to some length')
+    crop.add_argument('bedfile', help='BED file to crop')
+    crop.add_argument('-n', '--length', type=int, default=500000, help='Length of subsequence to leave')
+    crop.add_argument('-s', '--start', default='_START', help='Suffix of sequences cropped from the start')
+    crop.add_argument('-e', '--end', default='_END', help='Suffix of sequences cropped from the end')
+    crop.add_argument('-o', '--output', help='Output file, stdout by default')
+
+    ends = commands.add_parser('ends', help='Create BED file of sequence ends')
+    ends.add_argument('sizes', help='chromosome.sizes or .fai file')
+    ends.add_argument('-n', '--length', type=int, default=500000, help='Length of subtelomeres in bases')
+    ends.add_argument('-c', '--count', type=int, default=24, help='Only take first count sequences')
+    ends.add_argument('-s', '--sort', action='store_true', help='Sort sequences by length first')
+    ends.add_argument('-o', '--output', help='Output file, stdout by default')
+
+    full = commands.add_parser('full', help='Create BED file spanning whole sequences')
+    full.add_argument('sizes', help='chromosome.sizes or .fai file')
+    full.add_argument('-o', '--output', help='Output file, stdout by default')
+
+    args = parser.parse_args()
+
+    if args.command == 'crop':
+        features = crop_bed(read_lines(args.bedfile), args.length, args.start, args.end)
+    elif args.command == 'ends':
+        features = ends_bed(read_sizes(args.sizes), args.length, args.count, args.sort)
+    else:
+        features = full_bed(read_sizes(args.sizes))
+
+    write_bed(features, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -68,9 +68,10 @@ while getopts "n:c:so:h" o; do
 	esac
 done
 
-head -n "$count" "$file" | while read line; do
-    chrom="`echo "$line" | cut -f1`"
-    size="`echo "$line" | cut -f2`"
-    echo -e "$chrom\t0\t$len\t${chrom}_START"
-    echo -e "$chrom\t$(( $size - $len ))\t$size\t${chrom}_END"
-done > "$output"
+scriptdir=$(dirname $0)
+sort_opt=""
+if [ $sorting -eq 1 ]; then
+    sort_opt="-s"
+fi
+
+python3 $scriptdir/subtelo_bed.py ends "$file" -n "$len" -c "$count" $sort_opt -o "$output"
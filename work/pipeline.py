@@ -0,0 +1,333 @@
+#!/bin/python3.11
+
+import argparse
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from sys import stderr
+
+
+HELP="""
+Batch pipeline for subtelomere extraction and analysis of many assemblies.
+
+Reads a manifest of assemblies and runs the stages for each of them
+as a DAG on a bounded pool of workers:
+
+extract    get_subtelomeres/extract_subtelomeres.sh   -> <name>/subtelomeres.fa
+store      repeat-search/seqstore.py                  -> <name>/subtelomeres.sqs
+repeats    repeat-search/repeats.py                   -> <name>/repeats.bed
+families   repeat-search/families.py                  -> <name>/families.tsv, families.bed
+similarity repeat-search/kmer_similarity.py           -> <name>/similarity.tsv
+heatmap    similiarity-plot/event_counter.py          -> <name>/heatmap.png
+           (of ModDotPlot bedpe file if given in manifest,
+            of similarity matrix otherwise)
+
+Each finished stage records a stamp with content hashes of its inputs
+and outputs into <output>/<name>/.stamps/. On rerun, stages with unchanged
+command, inputs and outputs are skipped. Timings of all stages are written
+into <output>/timings.tsv.
+
+Manifest format (whitespace separated, lines starting with '#' are ignored):
+name    assembly.fa[.gz]    [moddotplot.bedpe]
+"""
+
+
+scriptdir = os.path.dirname(os.path.abspath(__file__))
+
+STAGES = ['extract', 'store', 'repeats', 'families', 'similarity', 'heatmap']
+
+
+def stderrprint(string):
+    print(string, file=stderr)
+
+
+def read_manifest(file):
+    """
+    Returns list of (name, fasta, bedpe or None) from manifest file.
+    Relative paths are taken relative to the manifest.
+    """
+    base = os.path.dirname(os.path.abspath(file))
+    assemblies = []
+    with open(file, 'r') as f:
+        for line_no, line in enumerate(f):
+            line = line.split()
+            if not line or line[0][0] == '#':
+                continue
+            if len(line) < 2:
+                stderrprint(f"Error on parsing manifest line {line_no+1}: {line}")
+                exit(1)
+            name, fasta = line[0], os.path.join(base, line[1])
+            bedpe = os.path.join(base, line[2]) if len(line) > 2 else None
+            assemblies.append((name, fasta, bedpe))
+    return assemblies
+
+
+def file_hash(path, known=None):
+    """
+    Returns (size, mtime_ns, sha256) of file.
+    The hash is reused from known record if size and mtime did not change.
+    """
+    stat = os.stat(path)
+    if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+        return known
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            sha.update(chunk)
+    return [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+
+
+class Stage:
+    def __init__(self, assembly, name, command, inputs, outputs, workdir, stdout=None, deps=()):
+        self.assembly = assembly
+        self.name = name
+        self.command = command
+        self.inputs = inputs
+        self.outputs = outputs
+        self.stdout = stdout
+        self.deps = list(deps)
+        self.stamp = os.path.join(workdir, '.stamps', f"{name}.json")
+        self.log = os.path.join(workdir, f"{name}.log")
+        self.status = 'pending'
+        self.seconds = 0.0
+
+    def __str__(self):
+        return f"{self.assembly}:{self.name}"
+
+    def read_stamp(self):
+        try:
+            with open(self.stamp, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def up_to_date(self):
+        """
+        Checks stamp against current command and content of inputs and outputs.
+        Hashes in the stamp are refreshed so that touched files are not rehashed.
+        """
+        stamp = self.read_stamp()
+        if stamp is None or stamp['command'] != self.command:
+            return False
+        for kind, files in (('inputs', self.inputs), ('outputs', self.outputs)):
+            if sorted(stamp[kind]) != sorted(files):
+                return False
+            for path in files:
+                if not os.path.exists(path):
+                    return False
+                known = stamp[kind][path]
+                current = file_hash(path, known)
+                if current[2] != known[2]:
+                    return False
+                stamp[kind][path] = current
+        self.write_stamp(stamp)
+        return True
+
+    def write_stamp(self, stamp=None):
+        if stamp is None:
+            stamp = {
+                'command': self.command,
+                'inputs': {path: file_hash(path) for path in self.inputs},
+                'outputs': {path: file_hash(path) for path in self.outputs},
+            }
+        os.makedirs(os.path.dirname(self.stamp), exist_ok=True)
+        with open(self.stamp + '.part', 'w') as f:
+            json.dump(stamp, f, indent=1)
+        os.replace(self.stamp + '.part', self.stamp)
+
+    def run(self, force=False):
+        """
+        Runs the stage unless it is up to date. Returns status of the stage.
+        """
+        start = time.perf_counter()
+        if not force and self.up_to_date():
+            self.seconds = time.perf_counter() - start
+            return 'skipped'
+
+        os.makedirs(os.path.dirname(self.log), exist_ok=True)
+        with open(self.log, 'w') as log:
+            if self.stdout:
+                with open(self.stdout + '.part', 'w') as out:
+                    result = subprocess.run(self.command, cwd=scriptdir, stdout=out, stderr=log)
+                if result.returncode == 0:
+                    os.replace(self.stdout + '.part', self.stdout)
+            else:
+                result = subprocess.run(self.command, cwd=scriptdir, stdout=log, stderr=log)
+
+        if result.returncode != 0 or not all(map(os.path.exists, self.outputs)):
+            self.seconds = time.perf_counter() - start
+            return 'failed'
+
+        self.write_stamp()
+        self.seconds = time.perf_counter() - start
+        return 'done'
+
+
+def build_stages(assemblies, output, stages=STAGES, subtelo_len=500000, chrom_count=46,
+                 repeats_options=()):
+    """
+    Creates DAG of stages for all assemblies in manifest order.
+    """
+    dag = []
+    for name, fasta, bedpe in assemblies:
+        workdir = os.path.join(output, name)
+        subtelomeres = os.path.join(workdir, 'subtelomeres.fa')
+
+        extract = None
+        if 'extract' in stages:
+            extract = Stage(name, 'extract', [
+                    'bash', os.path.join('get_subtelomeres', 'extract_subtelomeres.sh'), fasta,
+                    '-n', str(subtelo_len), '-c', str(chrom_count),
+                    '-t', os.path.join(workdir, 'temp'), '-o', subtelomeres, '-d',
+                ],
+                [fasta], [subtelomeres], workdir)
+            dag.append(extract)
+
+        # Later stages read the packed store instead of parsing FASTA again
+        sequences, sequences_dep = subtelomeres, extract
+        if 'store' in stages:
+            sequences = os.path.join(workdir, 'subtelomeres.sqs')
+            sequences_dep = Stage(name, 'store', [
+                    sys.executable, os.path.join('repeat-search', 'seqstore.py'), 'convert',
+                    subtelomeres, '-o', sequences,
+                ],
+                [subtelomeres], [sequences], workdir,
+                deps=[extract] if extract else [])
+            dag.append(sequences_dep)
+
+        repeats = os.path.join(workdir, 'repeats.bed')
+        repeats_stage = None
+        if 'repeats' in stages:
+            repeats_stage = Stage(name, 'repeats', [
+                    sys.executable, os.path.join('repeat-search', 'repeats.py'), sequences,
+                    *repeats_options,
+                ],
+                [sequences], [repeats], workdir, stdout=repeats,
+                deps=[sequences_dep] if sequences_dep else [])
+            dag.append(repeats_stage)
+
+        if 'families' in stages:
+            families = os.path.join(workdir, 'families.tsv')
+            families_bed = os.path.join(workdir, 'families.bed')
+            dag.append(Stage(name, 'families', [
+                    sys.executable, os.path.join('repeat-search', 'families.py'), repeats, sequences,
+                    '-o', families, '-b', families_bed,
+                ],
+                [repeats, sequences], [families, families_bed], workdir,
+                deps=[stage for stage in (repeats_stage, sequences_dep) if stage]))
+
+        similarity = os.path.join(workdir, 'similarity.tsv')
+        similarity_stage = None
+        if 'similarity' in stages:
+            similarity_stage = Stage(name, 'similarity', [
+                    sys.executable, os.path.join('repeat-search', 'kmer_similarity.py'), sequences,
+                    # assemblies are already run in parallel by the pool
+                    '-o', similarity, '-p', '1',
+                ],
+                [sequences], [similarity], workdir,
+                deps=[sequences_dep] if sequences_dep else [])
+            dag.append(similarity_stage)
+
+        if 'heatmap' in stages:
+            heatmap = os.path.join(workdir, 'heatmap.png')
+            if bedpe:
+                command, inputs, deps = [bedpe], [bedpe], []
+            else:
+                command, inputs = [similarity, '-m'], [similarity]
+                deps = [similarity_stage] if similarity_stage else []
+            dag.append(Stage(name, 'heatmap', [
+                    sys.executable, os.path.join('similiarity-plot', 'event_counter.py'), *command,
+                    '-o', heatmap,
+                ],
+                inputs, [heatmap], workdir, deps=deps))
+    return dag
+
+
+def schedule(dag, jobs=4, force=False):
+    """
+    Runs stages on pool of jobs workers, each stage as soon as all its
+    dependencies have finished. Dependents of failed stages are not run.
+    """
+    pending = list(dag)
+    running = dict()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for stage in list(pending):
+                if any(dep.status in ('failed', 'blocked') for dep in stage.deps):
+                    stage.status = 'blocked'
+                    pending.remove(stage)
+                    stderrprint(f"# Blocked {stage}")
+                elif all(dep.status in ('done', 'skipped') for dep in stage.deps):
+                    pending.remove(stage)
+                    stage.status = 'running'
+                    running[pool.submit(stage.run, force)] = stage
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                stage.status = future.result()
+                stderrprint(f"# {stage.status.capitalize()} {stage} ({stage.seconds:.1f}s)")
+    return dag
+
+
+def write_report(dag, file):
+    with open(file, 'w') as f:
+        f.write("#assembly\tstage\tstatus\tseconds\n")
+        for stage in dag:
+            f.write(f"{stage.assembly}\t{stage.name}\t{stage.status}\t{stage.seconds:.3f}\n")
+
+    totals = dict()
+    for stage in dag:
+        count, seconds = totals.get(stage.name, (0, 0.0))
+        totals[stage.name] = (count + (stage.status == 'done'), seconds + stage.seconds)
+    for name, (count, seconds) in totals.items():
+        stderrprint(f"# Stage {name}: {count} run, {seconds:.1f}s total")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='pipeline',
+        description=HELP,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('manifest', help='Manifest of assemblies')
+    parser.add_argument('-o', '--output', default='pipeline-output', help='Output directory')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Maximal number of concurrent stages')
+    parser.add_argument('-f', '--force', action='store_true', help='Rerun stages even if they are up to date')
+    parser.add_argument('-S', '--stages', default=",".join(STAGES), help='Comma separated list of stages to run')
+    parser.add_argument('-n', '--subtelo-len', type=int, default=500000, help='Length of extracted subtelomeres')
+    parser.add_argument('-c', '--chrom-count', type=int, default=46, help='Number of sequences to extract from')
+    parser.add_argument('-r', '--repeats-options', default='', help='Options passed to repeats.py, eg. "-k 20 -t 5"')
+
+    args = parser.parse_args()
+
+    stages = args.stages.split(",")
+    for stage in stages:
+        if stage not in STAGES:
+            stderrprint(f"Unknown stage {stage}, choose from {STAGES}")
+            exit(1)
+
+    output = os.path.abspath(args.output)
+    os.makedirs(output, exist_ok=True)
+
+    dag = build_stages(read_manifest(args.manifest), output, stages,
+                       subtelo_len=args.subtelo_len,
+                       chrom_count=args.chrom_count,
+                       repeats_options=shlex.split(args.repeats_options))
+    schedule(dag, args.jobs, args.force)
+    write_report(dag, os.path.join(output, 'timings.tsv'))
+
+    if any(stage.status in ('failed', 'blocked') for stage in dag):
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/bin/python3.11
+
+import argparse
+import random
+from sys import stderr
+
+from repeats import build_graph, repeats_search, windowed_search
+
+
+HELP="""
+Regression check of windowed search of repeats.py.
+
+Generates a record with a diverged tandem array longer than the window,
+searches it whole and in windows and compares bases covered by the hits.
+Repeats spanning several windows have to be joined over the seams,
+so the windowed coverage must not lose more than TOLERANCE of the full one.
+
+Exits with 1 if the check fails.
+
+Usage: check_windowed [Options]
+"""
+
+
+def stderrprint(string):
+    print(string, file=stderr)
+
+
+def tandem_record(unit_len=150, copies=200, flank=5000, divergence=0.01, seed=0):
+    rng = random.Random(seed)
+    bases = 'ACGT'
+    randseq = lambda n: ''.join(rng.choice(bases) for _ in range(n))
+    unit = randseq(unit_len)
+    array = ''.join(
+        ''.join(rng.choice(bases.replace(c, '')) if rng.random() < divergence else c for c in unit)
+        for _ in range(copies))
+    return randseq(flank) + array + randseq(flank), (flank, flank + len(array))
+
+
+def covered(hits):
+    bases = set()
+    for _, start, end, _ in hits:
+        bases.update(range(start, end))
+    return bases
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='check-windowed',
+        description=HELP,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('-W', '--window', type=int, default=12000, help='Size of windows')
+    parser.add_argument('-O', '--overlap', type=int, default=3000, help='Overlap of windows')
+    parser.add_argument('-c', '--copies', type=int, default=200, help='Copies of 150 bp unit in the array')
+    parser.add_argument('--tolerance', type=float, default=0.02, help='Allowed lost fraction of full coverage')
+
+    args = parser.parse_args()
+
+    sequence, array = tandem_record(copies=args.copies)
+    source = [("tandem", [sequence])]
+    graph_options = dict(k=20, scaling='log1p', abs_threshold=3, rel_threshold=0, suffix=7)
+    search_options = dict(MaxDrop=200, InsertionPenalty=10, GapPenalty=10, BasePenalty=2, exact_start=7)
+
+    graph = build_graph(source, **graph_options)
+    full = list(repeats_search(source, graph, **search_options))
+    windowed = list(windowed_search(source, args.window, args.overlap, graph_options, search_options))
+
+    full_bases, windowed_bases = covered(full), covered(windowed)
+    lost = len(full_bases - windowed_bases) / max(1, len(full_bases))
+    stderrprint(f"# Array {array[0]}-{array[1]}, window {args.window}")
+    stderrprint(f"# Full hits: {[hit[1:3] for hit in full]}")
+    stderrprint(f"# Windowed hits: {[hit[1:3] for hit in windowed]}")
+    stderrprint(f"# Lost {lost:.1%} of full coverage")
+
+    if array[1] - array[0] <= args.window or not full or lost > args.tolerance:
+        stderrprint("Check failed")
+        exit(1)
+    stderrprint("Check passed")
+
+
+if __name__ == '__main__':
+    main()
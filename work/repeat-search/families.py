@@ -0,0 +1,250 @@
+#!/bin/python3.11
+
+import argparse
+import heapq
+from collections import Counter
+from zlib import crc32
+from sys import stderr, stdout
+
+from seqstore import read_records
+
+
+HELP="""
+Groups hits from repeats.py into repeat families.
+
+First, overlapping (and book-ended) hits on each sequence are merged using
+a sorted sweep. Then each merged interval is sketched as bottom-s MinHash
+of its canonical k-meres and intervals with estimated Jaccard similarity
+of at least the threshold are joined into one family. Candidate pairs only
+come from intervals sharing some sketch value, so there is no all-vs-all
+comparison.
+
+Only k-meres occurring at least --min-count times in the interval are
+sketched. Copies in a tandem array diverge independently, so k-meres
+with mutations are mostly unique and would dominate the k-mere set,
+while the repeated ones describe the unit. On tandem arrays of two units
+with 3% divergence of copies, Jaccard of all 15-meres of arrays of the same
+unit was 0.09-0.16, of 15-meres occurring at least twice 0.5-0.9
+(and below 0.01 for different units), hence the defaults. Intervals where
+repeated k-meres make less than 10% of all k-meres are not tandem arrays
+(they were over 25% on the arrays) and are sketched whole.
+
+Outputs a family table:
+family  intervals  hits  total_length  sequences  representative
+and optionally the merged intervals as BED with family in the name field:
+sequence  start  end  family  value  hits
+
+Usage: families repeats.bed file.fa|file.sqs [-o table] [-b bed] [Options]
+"""
+
+
+complement = str.maketrans('ACGTN', 'TGCAN')
+
+
+def stderrprint(string):
+    print(string, file=stderr)
+
+
+def read_hits(file):
+    """
+    Reads output of repeats.py as list of (sequence, start, end, value).
+    Sequence names may contain spaces, values are always last three fields.
+    """
+    hits = []
+    with open(file, 'r') as f:
+        for line in f:
+            if not line.strip() or line[0] == '#':
+                continue
+            chrom, start, end, value = line.rstrip('\n').rsplit(maxsplit=3)
+            hits.append((chrom, int(start), int(end), float(value)))
+    return hits
+
+
+def merge_hits(hits, distance=0):
+    """
+    Merges hits closer than distance on each sequence.
+    Returns list of [sequence, start, end, max value, number of hits]
+    sorted by sequence and start.
+    """
+    merged = []
+    for chrom, start, end, value in sorted(hits):
+        if merged and merged[-1][0] == chrom and start <= merged[-1][2] + distance:
+            last = merged[-1]
+            last[2] = max(last[2], end)
+            last[3] = max(last[3], value)
+            last[4] += 1
+        else:
+            merged.append([chrom, start, end, value, 1])
+    return merged
+
+
+def load_sequences(file, names):
+    """
+    Loads records with given names. Unknown bases are left out, the same
+    way repeats.py counts positions.
+    """
+    sequences = dict()
+    for seq_id, chunks in read_records(file):
+        if seq_id in names:
+            sequences[seq_id] = "".join(chunks).replace('N', '')
+        else:
+            for _ in chunks:
+                pass
+    return sequences
+
+
+def sketch(sequence, k=15, size=64, min_count=1, min_solid=0.1):
+    """
+    Bottom-size MinHash sketch of canonical k-meres of sequence.
+    With min_count > 1 only k-meres occurring at least min_count times
+    are sketched, if they make at least min_solid of all k-meres.
+    """
+    reverse = sequence.translate(complement)[::-1]
+    length = len(sequence)
+    kmeres = (min(sequence[i:i+k], reverse[length-i-k:length-i]) for i in range(length - k + 1))
+    if min_count > 1:
+        counts = Counter(kmeres)
+        solid = [kmere for kmere, count in counts.items() if count >= min_count]
+        # A few repeated k-meres (eg. poly-A run) do not describe the sequence
+        if solid and sum(counts[kmere] for kmere in solid) >= min_solid * (length - k + 1):
+            kmeres = solid
+        else:
+            kmeres = counts
+    hashes = {crc32(kmere.encode()) for kmere in kmeres}
+    return set(heapq.nsmallest(size, hashes))
+
+
+def jaccard(a, b, size=64):
+    """
+    Estimates Jaccard similarity of two bottom-size sketches.
+    """
+    union = sorted(a | b)[:size]
+    if not union:
+        return 0
+    shared = a & b
+    return sum(1 for h in union if h in shared) / len(union)
+
+
+class UnionFind:
+    def __init__(self, count):
+        self.parent = list(range(count))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x, y):
+        x, y = self.find(x), self.find(y)
+        if x != y:
+            self.parent[max(x, y)] = min(x, y)
+
+
+def cluster(sketches, threshold=0.3, size=64, max_bucket=32):
+    """
+    Joins sketches with estimated Jaccard similarity >= threshold.
+
+    Index of sketch values keeps at most max_bucket intervals per value,
+    as intervals of one family get joined transitively anyway.
+    Returns list of family roots, one for each sketch.
+    """
+    families = UnionFind(len(sketches))
+    index = dict()
+    for idx, current in enumerate(sketches):
+        candidates = set()
+        for h in current:
+            bucket = index.setdefault(h, [])
+            candidates.update(bucket)
+            if len(bucket) < max_bucket:
+                bucket.append(idx)
+
+        for other in candidates:
+            if families.find(other) == families.find(idx):
+                continue
+            if jaccard(current, sketches[other], size) >= threshold:
+                families.union(idx, other)
+    return [families.find(idx) for idx in range(len(sketches))]
+
+
+def repeat_families(hits, sequences_file, k=15, size=64, threshold=0.3, distance=0, min_count=2):
+    """
+    Merges hits and assigns a family to each merged interval.
+
+    Returns (intervals, families) where intervals are merged hits extended
+    by family number and families is the family table, both sorted by size
+    of family (largest first).
+    """
+    merged = merge_hits(hits, distance)
+    sequences = load_sequences(sequences_file, {chrom for chrom, *_ in merged})
+    sketches = [sketch(sequences.get(chrom, "")[start:end], k, size, min_count)
+                for chrom, start, end, _, _ in merged]
+    roots = cluster(sketches, threshold, size)
+
+    members = dict()
+    for interval, root in zip(merged, roots):
+        members.setdefault(root, []).append(interval)
+
+    ordered = sorted(members.values(), key=lambda x: (-len(x), x[0][0], x[0][1]))
+    families, intervals = [], []
+    for family, group in enumerate(ordered):
+        representative = max(group, key=lambda x: x[3])
+        families.append([
+            family, len(group),
+            sum(hits for *_, hits in group),
+            sum(end - start for _, start, end, _, _ in group),
+            len({chrom for chrom, *_ in group}),
+            f"{representative[0]}:{representative[1]}-{representative[2]}",
+        ])
+        intervals += [[chrom, start, end, family, value, hits]
+                      for chrom, start, end, value, hits in group]
+    intervals.sort(key=lambda x: (x[0], x[1]))
+    return intervals, families
+
+
+def write_table(rows, output=None, header=None):
+    out = open(output, 'w') if output else stdout
+    if header:
+        out.write(header + "\n")
+    for row in rows:
+        out.write("\t".join(map(str, row)) + "\n")
+    if output:
+        out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='families',
+        description=HELP,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('repeats_file', help='Output of repeats.py')
+    parser.add_argument('sequences', help='Fasta file or sequence store searched by repeats.py')
+    parser.add_argument('-o', '--output', help='Output family table, stdout by default')
+    parser.add_argument('-b', '--bed', help='Also write merged intervals with families as BED file')
+    parser.add_argument('-k', '--kmer_len', type=int, default=15, help='Length of k-meres in sketches')
+    parser.add_argument('-s', '--sketch-size', type=int, default=64, help='Number of hashes kept in sketch')
+    parser.add_argument('-j', '--jaccard', type=float, default=0.3, help='Minimal estimated Jaccard similarity within family')
+    parser.add_argument('-c', '--min-count', type=int, default=2, help='Only sketch k-meres occurring at least this many times in interval')
+    parser.add_argument('-d', '--distance', type=int, default=0, help='Merge hits at most this far apart')
+
+    args = parser.parse_args()
+
+    hits = read_hits(args.repeats_file)
+    intervals, families = repeat_families(
+            hits, args.sequences,
+            k=args.kmer_len,
+            size=args.sketch_size,
+            threshold=args.jaccard,
+            distance=args.distance,
+            min_count=args.min_count)
+    stderrprint(f"# {len(hits)} hits, {len(intervals)} merged intervals, {len(families)} families")
+
+    write_table(families, args.output,
+                header="#family\tintervals\thits\ttotal_length\tsequences\trepresentative")
+    if args.bed:
+        write_table(intervals, args.bed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/bin/python3.11
+
+import argparse
+import heapq
+import os
+import re
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from sys import stderr, stdout
+
+from seqstore import read_records
+from families import sketch
+
+
+HELP="""
+Computes all-pairs k-mere similarity matrix of sequences without ModDotPlot.
+
+Each record is sketched as bottom-s MinHash of its canonical k-meres
+(records are sketched in parallel), then similarity is estimated for every
+pair of records. Runs of N split the record into parts which are sketched
+separately, so that no k-mere spans a gap. Multiple files (eg. haplotypes
+or different people) may be given, then labels are prefixed with the file
+path relative to the common directory of the files without extension,
+or with name if the file is given as name=path. Labels repeated anyway
+get suffix #2, #3, ...
+
+Output is a tab-separated matrix with labels in first row and column,
+which can be plotted by similiarity-plot/event_counter.py -m.
+
+Usage: kmer_similarity [name=]file.fa|file.sqs [[name2=]file2 ...] [-o matrix.tsv] [Options]
+"""
+
+
+def stderrprint(string):
+    print(string, file=stderr)
+
+
+def similarity(a, b, containment=False):
+    """
+    Estimates Jaccard similarity (or containment of a in b) from sketches
+    given as (set, sorted list).
+
+    All hashes of both k-mere sets up to the smaller of sketch maxima
+    are present in the sketches, so the estimate uses them all
+    instead of merging the sketches.
+    """
+    (a_set, a_sorted), (b_set, b_sorted) = a, b
+    if not a_sorted or not b_sorted:
+        return 0
+    cutoff = min(a_sorted[-1], b_sorted[-1])
+    shared = sum(1 for h in a_set & b_set if h <= cutoff)
+    in_a = bisect_right(a_sorted, cutoff)
+    total = in_a if containment else in_a + bisect_right(b_sorted, cutoff) - shared
+    return shared / total if total else 0
+
+
+def file_prefixes(files):
+    """
+    Returns (prefix, path) for files given as path or name=path.
+    """
+    named = [file.split('=', 1) if '=' in file and not os.path.exists(file) else [None, file]
+             for file in files]
+    if len(files) == 1:
+        return [("", path) for _, path in named]
+    common = os.path.commonpath([os.path.abspath(path) for _, path in named])
+    prefixes = []
+    for name, path in named:
+        if name is None:
+            name = os.path.relpath(os.path.abspath(path), common)
+            for extension in ('.gz', '.sqs', '.fasta', '.fa', '.fna'):
+                name = name.removesuffix(extension)
+        prefixes.append((name + ":", path))
+    return prefixes
+
+
+def unique_labels(labels):
+    seen = dict()
+    unique = []
+    for label in labels:
+        seen[label] = seen.get(label, 0) + 1
+        unique.append(label if seen[label] == 1 else f"{label}#{seen[label]}")
+    return unique
+
+
+def record_sketch(sequence, k=21, size=10000):
+    """
+    Sketch of record, parts between runs of N are sketched separately.
+    """
+    hashes = set()
+    for part in re.split('N+', sequence):
+        hashes |= sketch(part, k, size)
+    return set(heapq.nsmallest(size, hashes))
+
+
+def record_sketches(files, k=21, size=10000, jobs=None):
+    """
+    Returns (labels, sketches) for all records of files.
+    """
+    labels, futures = [], []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for prefix, file in file_prefixes(files):
+            for seq_id, chunks in read_records(file):
+                labels.append(prefix + seq_id)
+                futures.append(pool.submit(record_sketch, "".join(chunks), k, size))
+        sketches = [future.result() for future in futures]
+    return unique_labels(labels), [(hashes, sorted(hashes)) for hashes in sketches]
+
+
+def similarity_matrix(sketches, containment=False):
+    count = len(sketches)
+    matrix = [[0.0 for _ in range(count)] for _ in range(count)]
+    for i in range(count):
+        for j in range(count if containment else i + 1):
+            matrix[i][j] = similarity(sketches[i], sketches[j], containment)
+            if not containment:
+                matrix[j][i] = matrix[i][j]
+    return matrix
+
+
+def write_matrix(labels, matrix, output=None):
+    out = open(output, 'w') if output else stdout
+    out.write("\t".join(["#"] + labels) + "\n")
+    for label, row in zip(labels, matrix):
+        out.write("\t".join([label] + [f"{value:.6f}" for value in row]) + "\n")
+    if output:
+        out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='kmer-similarity',
+        description=HELP,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('sequences', nargs='+', help='Fasta files or sequence stores, optionally as name=path')
+    parser.add_argument('-o', '--output', help='Output matrix, stdout by default')
+    parser.add_argument('-k', '--kmer_len', type=int, default=21, help='Length of k-meres')
+    parser.add_argument('-s', '--sketch-size', type=int, default=10000, help='Number of hashes kept in sketch')
+    parser.add_argument('-c', '--containment', action='store_true', help='Estimate containment of row in column instead of Jaccard')
+    parser.add_argument('-p', '--processes', type=int, help='Number of processes, all cpus by default')
+
+    args = parser.parse_args()
+
+    stderrprint("# Sketching records")
+    labels, sketches = record_sketches(args.sequences, args.kmer_len, args.sketch_size, args.processes)
+    stderrprint(f"# Comparing {len(labels)} records")
+    matrix = similarity_matrix(sketches, args.containment)
+    write_matrix(labels, matrix, args.output)
+
+
+if __name__ == '__main__':
+    main()
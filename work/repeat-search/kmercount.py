@@ -3,14 +3,15 @@
 from sys import argv
 import math
 
-file = argv[1]
+from seqstore import read_records
+
 window = 2
 
 width = 180
 all_lines = True
 
 
-def result_table(results, width=width, show=100):
+def result_table(results, width=width, show=100, window=window):
     results = sorted(results.items(), key=lambda x: x[1], reverse=True)
     results = results[:show]
     show = len(results)
@@ -29,25 +30,31 @@ def result_table(results, width=width, show=100):
         print()
 
 
-with open(file, 'r') as f:
-    ch = ' '
-    while len(ch) > 0:
+def kmer_counts(file, window=window):
+    """
+    Yields (sequence_id, counts of k-meres of length window) for each record.
+    """
+    for chrom, chunks in read_records(file):
         slides = dict()
+        word = ""
+        for chunk in chunks:
+            for ch in chunk:
+                word = (word + ch)[-window:]
+                if len(word) == window:
+                    slides[word] = slides.get(word, 0) + 1
+        yield chrom, slides
 
-        chrom = f.readline()[:-1]
-        if len(chrom) > 0:
-            print(f"Stats for {chrom}")  # header
-        
-        word = f.read(window)
-        if len(word) == 0:
-            break
 
-        slides[word] = 1
-        while (ch := f.read(1)) != '\n' and len(ch) > 0:
-            word = word[1:] + ch
-            slides[word] = slides.get(word, 0) + 1
+def main():
+    for chrom, slides in kmer_counts(argv[1]):
+        print(f"Stats for >{chrom}")  # header
 
-        result_table(slides)
+        if slides:
+            result_table(slides)
 
         if not all_lines:
             break
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Opt-in instrumentation for repeats.py (see option --profile).
+
+SearchStats collects counters of the search. The search only touches it
+once per read base and once per restart, and not at all when profiling
+is off. Profiler optionally runs cProfile or a simple sampling profiler
+over the whole run.
+"""
+
+import cProfile
+import io
+import pstats
+import signal
+import time
+from collections import Counter
+
+
+class SearchStats:
+    def __init__(self):
+        self.phases = dict()
+        self.restarts = 0
+        self.positions = 0
+        self.states = 0
+        self.expanded = 0
+        self.gaps = 0
+        self.matches = 0
+        self.insertions = 0
+        self.reread = 0
+        self.skipped = 0
+        self.buckets = Counter()
+        self._phase = None
+
+    def phase(self, name):
+        """
+        Starts timing of phase name, ending the previous one.
+        """
+        now = time.perf_counter()
+        if self._phase is not None:
+            last, start = self._phase
+            self.phases[last] = self.phases.get(last, 0) + now - start
+        self._phase = (name, now) if name else None
+
+    def position(self, current_states, next_states, queued, expanded, matched, inserted):
+        """
+        Called after all states for one base were processed.
+        queued is number of states in current_states before processing,
+        states appended since then come from gap relaxations. expanded
+        counts states not dropped below the flood. matched and inserted
+        count relaxations which improved value of a state for the next base,
+        including states already queued.
+        """
+        states = sum(map(len, current_states))
+        self.positions += 1
+        self.states += states
+        self.expanded += expanded
+        self.gaps += states - queued
+        self.matches += matched
+        self.insertions += inserted
+        for batch in next_states:
+            if batch:
+                self.buckets[len(batch).bit_length()] += 1
+
+    def report(self):
+        lines = ["# Phases (seconds)"]
+        lines += [f"{name}\t{seconds:.3f}" for name, seconds in self.phases.items()]
+        lines += [
+            "# Search counters",
+            f"search restarts\t{self.restarts}",
+            f"bases searched\t{self.positions}",
+            f"queued states (including skipped and stale)\t{self.states}",
+            f"states expanded\t{self.expanded}",
+            f"gap relaxations\t{self.gaps}",
+            f"match relaxations\t{self.matches}",
+            f"insert relaxations\t{self.insertions}",
+            f"bases re-read after reset\t{self.reread}",
+            f"bases skipped by reset\t{self.skipped}",
+            "# Sizes of next_states buckets (upper bound: count)",
+        ]
+        lines += [f"<{1 << bits}\t{count}" for bits, count in sorted(self.buckets.items())]
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """
+    Samples innermost Python frame every interval seconds of CPU time.
+    """
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = Counter()
+
+    def _sample(self, signum, frame):
+        if frame is not None:
+            code = frame.f_code
+            self.samples[(code.co_filename, code.co_name, frame.f_lineno)] += 1
+
+    def enable(self):
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def disable(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def report(self, top=30):
+        total = sum(self.samples.values())
+        lines = [f"# Sampling profile, {total} samples every {self.interval*1000:g} ms",
+                 "# samples\tpercent\tfunction\tline"]
+        for (file, function, line), count in self.samples.most_common(top):
+            lines.append(f"{count}\t{100*count/total:.1f}\t{function} ({file})\t{line}")
+        return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    """
+    Wraps cProfile ('cprofile') or SamplingProfiler ('sampling').
+    """
+    def __init__(self, kind):
+        self.kind = kind
+        self.profiler = cProfile.Profile() if kind == 'cprofile' else SamplingProfiler()
+
+    def __enter__(self):
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *_):
+        self.profiler.disable()
+
+    def report(self, top=30):
+        if self.kind == 'sampling':
+            return self.profiler.report(top)
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(top)
+        return "# cProfile\n" + out.getvalue()
@@ -6,6 +6,10 @@ from typing import Dict, Tuple
 from heapq import nlargest
 import itertools
 from sys import stderr
+from contextlib import nullcontext
+from collections import deque
+
+from seqstore import read_records
 
 HELP="""
 This script provides a way of search for repeated sequence in fasta file.
@@ -15,6 +19,16 @@ on nodes and probabilities of adding next character on edges. In the second
 step the algorithm nondeterministically chooses a cycle in graph. Then it
 searches the sequence for the subsequence defined by the cycle using algorithm
 similiar to the one of `seqtk telo`.
+
+With --window, records are searched in overlapping windows, each with
+graph built only from the window, so memory does not grow with length
+of chromosome. Hits overlapping in overlap of windows are joined, so repeats
+longer than the window are reported whole. Weights of the graph come from
+counts of k-meres in the window, so the window should be much longer than
+units of the searched repeats.
+
+The script may also be imported, build_graph creates the Graph and
+repeats_search yields the found repeats for it.
 """
 
 Kmere = str
@@ -34,30 +48,6 @@ rescale = {
         }
 
 
-parser = argparse.ArgumentParser(
-    prog='repeats',
-    description=HELP,
-)
-
-parser.add_argument('fasta_file', help='Bedpe file with sequences to search through')
-parser.add_argument('-k', '--kmer_len', type=int, help='''Set length of k-meres''', default=20)
-parser.add_argument('-t', '--abs-threshold', type=float, help='''Minimal number a k-mere has to be in the sequence to be considered to be searched for''', default=3)
-parser.add_argument('-T', '--rel-threshold', type=float, help='''Only kmeres that are more frequent than REL_THRESHOLD * max frequency after rescaling''', default=0)
-parser.add_argument('-S', '--scaling', type=str, help='''Add scaling of the frequences''', default='log1p', choices=rescale)
-
-parser.add_argument('-m', '--max-drop', type=int, help='''Maximal drop in score to still count as one sequence''', default=200)
-parser.add_argument('-i', '--insert-pen', type=float, help='''Penalty for insertion''', default=10)
-parser.add_argument('-g', '--gap-pen', type=float, help='''Penalty for gap''', default=10)
-parser.add_argument('-b', '--base-pen', type=float, help='''Penalty that is added in each step''', default=2)
-parser.add_argument('-s', '--skip', type=int, help='''Skip first n bases of file''', default=0)
-parser.add_argument('-e', '--exact-match', type=int, help='''Speed up the search by looking for exact matches of defined length at start of repetition''', default=7)
-
-args = parser.parse_args()
-
-fasta = args.fasta_file
-k_len = args.kmer_len if args.kmer_len else 10
-
-
 def stderrprint(string):
     print(string, file=stderr)
 
@@ -66,44 +56,45 @@ class CharNotAllowed(Exception):
     pass
 
 
+def records(source):
+    """
+    Records of fasta file, sequence store or list of (sequence_id, chunks).
+    """
+    if isinstance(source, str):
+        return read_records(source)
+    return iter(source)
+
+
 """
-Generator of sequence from fasta file.
+Generator of sequence from fasta file or sequence store (see seqstore.py).
 
 When reading character that is not allowed, raises:
-    CharNotAllowed((sequence_id, char, kmere, position_in_seq, line))
+    CharNotAllowed((sequence_id, char, kmere, position_in_seq, chunk))
 Else yields tuple corresponding to:
-    (sequence_id, added_char, kmere, position_in_seq, line)
+    (sequence_id, added_char, kmere, position_in_seq, chunk)
 """
 def fasta_reader(file, k=10, skip=0):
-    with open(file, 'r') as fa:
-        seq_id = ""
-        kmere = ""
+    kmere = ""
+    for seq_id, chunks in records(file):
         pos = 0
-        for line_no, line in enumerate(fa):
-            if line[0] == '>':
-                seq_id = line[1:-1]
-                pos = 0
-                continue
-
-            for char in line:
+        for chunk_no, chunk in enumerate(chunks):
+            for char in chunk:
                 if char in unknowns:
                     kmere = ""
                     continue
-                elif char in allowed_whitespace:
-                    continue
                 elif char not in allowed_chars:
-                    raise CharNotAllowed((seq_id, char, kmere, pos, line_no))
+                    raise CharNotAllowed((seq_id, char, kmere, pos, chunk_no))
 
                 kmere = (kmere + char)[-k:]
                 if skip <= 0:
-                    yield (seq_id, char, kmere, pos, line_no)
+                    yield (seq_id, char, kmere, pos, chunk_no)
                 else:
                     skip -= 1
                 pos += 1
 
 class base_reader:
     def __init__(self, file):
-        self.fa = open(file, 'r')
+        self.file = file
         self.seq_id = ""
         self.buffer = []
         self.offset = 0
@@ -111,6 +102,9 @@ class base_reader:
         self.seq_offset = 0
         self.reader = self.file_read()
         self.seq_offsets = {}
+        # Bases served again from buffer and skipped over by reset
+        self.reread = 0
+        self.skipped = 0
 
     def __iter__(self):
         return self
@@ -127,30 +121,27 @@ class base_reader:
         return (self.seq_id, char)
 
     def file_read(self):
-        for line in self.fa:
-            if line[0] == '>':
-                self.seq_id = line[1:-1]
-                self.seq_offsets[self.seq_id] = self.start + self.offset
-                continue
-
-            for char in line:
-                if char in unknowns:
-                    kmere = ""
-                    continue
-                elif char in allowed_whitespace:
-                    continue
-                elif char not in allowed_chars:
-                    raise CharNotAllowed((seq_id, char))
+        for seq_id, chunks in records(self.file):
+            self.seq_id = seq_id
+            self.seq_offsets[self.seq_id] = self.start + self.offset
+            for chunk in chunks:
+                for char in chunk:
+                    if char in unknowns:
+                        continue
+                    elif char not in allowed_chars:
+                        raise CharNotAllowed((self.seq_id, char))
 
-                yield (self.seq_id, char)
+                    yield (self.seq_id, char)
 
     def reset(self, start):
         assert start >= self.start
         if self.start + len(self.buffer) > start:
             self.buffer = self.buffer[(start-self.start):]
+            self.reread += len(self.buffer)
         else:
             for _ in range(start - self.start - len(self.buffer)):
                 next(self.reader)
+                self.skipped += 1
             self.buffer = []
         self.start = start
         self.offset = 0
@@ -179,7 +170,8 @@ class Node:
 
 
 class Graph:
-    def __init__(self, graph, suffix=1):
+    def __init__(self, graph, k, suffix=1):
+        self.k = k
         self.kmere_mapping = dict()
         self.nodes = []
         for idx, kmere in enumerate(graph):
@@ -199,7 +191,9 @@ class Graph:
                 for base in allowed_chars:
                     _suffix[base+suf] = []
                 for node in nodes:
-                    _suffix[node.kmere[-suf_len:]].append(node)
+                    # k-meres cut short by start of record or N are too short
+                    if len(node.kmere) >= suf_len:
+                        _suffix[node.kmere[-suf_len:]].append(node)
             self.by_suffix.append(_suffix)
 
         self.bases = [[], [], [], []]
@@ -211,7 +205,7 @@ class Graph:
 
     def assign(self, kmere, aminoacid, value):
         aa = aamapper(aminoacid)
-        other = (kmere + aminoacid)[-k_len:]
+        other = (kmere + aminoacid)[-self.k:]
         # TODO: For some reason kmere mapping does not contain kmere sometimes
         # This might be due to N's and ends of sequences
         if other not in self.kmere_mapping:
@@ -261,7 +255,7 @@ def prune_graph(graph, abs_threshold=-1, rel_threshold=0):
 
 
 # Legacy
-def pick_cycle(graph):
+def pick_cycle(graph, k_len):
     gone = {kmer: -1 for kmer in graph}
 
     kmer = list(graph)[random.randrange(len(graph))]
@@ -346,7 +340,7 @@ MaxDrop, InsertionPenalty, GapPenalty, BasePenalty
 Return MinPosition, MaxPosition
 """
 def single_search(sequence, graph, MaxDrop=200, InsertionPenalty=3, GapPenalty=3, BasePenalty=1,
-                  offset=0, exact_start=3):
+                  offset=0, exact_start=3, stats=None):
     max_value = -1
     max_position = offset+exact_start
     min_position = offset
@@ -386,6 +380,9 @@ def single_search(sequence, graph, MaxDrop=200, InsertionPenalty=3, GapPenalty=3
 
             _flood = flood + max(0, max_value - MaxDrop)
 
+            if stats is not None:
+                queued = sum(map(len, current_states))
+            expanded = matched = inserted = 0
 
             for batch in current_states:
                 for allow_insert, state in batch:
@@ -393,6 +390,7 @@ def single_search(sequence, graph, MaxDrop=200, InsertionPenalty=3, GapPenalty=3
                     start, value = values[state_idx]
                     if value < _flood:
                         continue
+                    expanded += 1
 
                     if value <= 0:
                         state_start = position - 1
@@ -409,6 +407,7 @@ def single_search(sequence, graph, MaxDrop=200, InsertionPenalty=3, GapPenalty=3
                             new_value = value + increment
                             correct = (position, new_value)
                             if next_values[n_idx] < correct:
+                                matched += 1
                                 if new_value - flood > max_value:
                                     max_value = new_value - flood
                                     min_position = state_start
@@ -428,10 +427,14 @@ def single_search(sequence, graph, MaxDrop=200, InsertionPenalty=3, GapPenalty=3
                     if allow_insert and (new_value := value - InsertionPenalty) > _flood:
                         insertion = (position, new_value)
                         if next_values[state_idx] < insertion:
+                            inserted += 1
                             next_states[int((max_value+flood - new_value)/GapPenalty)].append((True, state))
                             next_values[state_idx] = insertion
                             next_starts[state_idx] = state_start
 
+            if stats is not None:
+                stats.position(current_states, next_states, queued, expanded, matched, inserted)
+
             flood += BasePenalty
 
         return chrom, min_position, max_position, max_value, position
@@ -441,12 +444,15 @@ def single_search(sequence, graph, MaxDrop=200, InsertionPenalty=3, GapPenalty=3
         return chrom, min_position, max_position, max_value, position
 
 
-def repeats_search(fasta, graph, MinValue=200, MaxDrop=200, InsertionPenalty=3, GapPenalty=3, BasePenalty=1, fast_skip=True, skip=0, exact_start=3):
+def repeats_search(fasta, graph, MinValue=200, MaxDrop=200, InsertionPenalty=3, GapPenalty=3, BasePenalty=1, fast_skip=True, skip=0, exact_start=3,
+                   stats=None):
     stderrprint("# Starting search procedure")
     position = skip
     value = 0
     last_report = 0
     reader = base_reader(fasta)
+    # Windows have readers of their own, so only increments are added to stats
+    reread = skipped = 0
     reader.reset(skip)
 
     while value >= 0:
@@ -454,6 +460,13 @@ def repeats_search(fasta, graph, MinValue=200, MaxDrop=200, InsertionPenalty=3,
             reader.reset(position)
         except StopIteration:
             return
+        finally:
+            if stats is not None:
+                stats.reread += reader.reread - reread
+                stats.skipped += reader.skipped - skipped
+                reread, skipped = reader.reread, reader.skipped
+        if stats is not None:
+            stats.restarts += 1
         chrom, start, end, value, p_end = \
                 single_search(reader, graph,
                               MaxDrop=MaxDrop,
@@ -461,7 +474,8 @@ def repeats_search(fasta, graph, MinValue=200, MaxDrop=200, InsertionPenalty=3,
                               GapPenalty=GapPenalty,
                               BasePenalty=BasePenalty,
                               offset=position,
-                              exact_start=exact_start)
+                              exact_start=exact_start,
+                              stats=stats)
 
         if value > MinValue:
             offset = reader.get_offset(chrom)
@@ -481,22 +495,215 @@ def repeats_search(fasta, graph, MinValue=200, MaxDrop=200, InsertionPenalty=3,
             stderrprint(f"# Now at base: {position}")
 
 
-stderrprint("# Generating graph of k-meres")
-graph = generate_graph(fasta, k_len)
-stderrprint("# Scaling graph of k-meres")
-graph = scale_graph(graph, args.scaling)
-stderrprint("# Pruning graph of k-meres")
-graph = prune_graph(graph, args.abs_threshold, args.rel_threshold)
-stderrprint("# Transforming graph of k-meres")
-graph = Graph(graph, suffix=args.exact_match)
+def report_phase(message, stats=None):
+    stderrprint(message)
+    if stats is not None:
+        stats.phase(message[2:])
+
+
+def build_graph(fasta, k=20, scaling="log1p", abs_threshold=3, rel_threshold=0, suffix=7, stats=None):
+    """
+    Builds searchable Graph of k-meres of fasta file (or sequence store).
+    """
+    report_phase("# Generating graph of k-meres", stats)
+    graph = generate_graph(fasta, k)
+    report_phase("# Scaling graph of k-meres", stats)
+    graph = scale_graph(graph, scaling)
+    report_phase("# Pruning graph of k-meres", stats)
+    graph = prune_graph(graph, abs_threshold, rel_threshold)
+    report_phase("# Transforming graph of k-meres", stats)
+    return Graph(graph, k, suffix=suffix)
 
 
-for chrom, start, end, value in repeats_search(
-        fasta, graph,
+"""
+Generator of overlapping windows of records for windowed search.
+
+Windows are taken from the sequence including N's, so k-meres are still
+broken on them, but offsets are counted without N's the same way as
+positions in repeats_search. Only one window of each record is kept in memory.
+Yields tuples (sequence_id, offset, window).
+"""
+def windows(source, size, overlap):
+    step = size - overlap
+    for seq_id, chunks in records(source):
+        buffer = ""
+        offset = 0
+        first = True
+        for chunk in chunks:
+            buffer += chunk
+            while len(buffer) >= size:
+                yield seq_id, offset, buffer[:size]
+                first = False
+                offset += step - buffer[:step].count('N')
+                buffer = buffer[step:]
+        # Rest of record shorter than overlap was searched in the last window
+        if buffer and (first or len(buffer) > overlap):
+            yield seq_id, offset, buffer
+
+
+def search_window(window, graph_options, search_options, stats=None):
+    """
+    Builds local graph of single window and searches it.
+    Returns (sequence_id, offset, hits) with hits in record coordinates.
+    """
+    seq_id, offset, sequence = window
+    source = [(seq_id, [sequence])]
+    graph = build_graph(source, stats=stats, **graph_options)
+    report_phase("# Searching for repeats", stats)
+    hits = [(chrom, start + offset, end + offset, value)
+            for chrom, start, end, value in repeats_search(source, graph, stats=stats, **search_options)]
+    return seq_id, offset, hits
+
+
+class seam_merger:
+    """
+    Joins hits of consecutive windows of a record.
+
+    Hits of one window never overlap, so only hits of previous windows
+    reaching over the start of the new window are compared with new ones.
+    Overlapping hits are parts of one repeat cut by ends of windows (or
+    the same repeat found twice), so they are joined into their union
+    with the higher of the values.
+    """
+    def __init__(self):
+        self.seq_id = None
+        self.kept = []
+
+    def add(self, seq_id, offset, hits):
+        """
+        Adds hits of next window, returns hits that are final.
+        """
+        if seq_id != self.seq_id:
+            done, self.kept = self.flush(), []
+            self.seq_id = seq_id
+        else:
+            done = sorted((hit for hit in self.kept if hit[2] <= offset), key=lambda x: x[1])
+            self.kept = [hit for hit in self.kept if hit[2] > offset]
+
+        joined = []
+        for hit in sorted(self.kept + list(hits), key=lambda x: x[1]):
+            if joined and hit[1] < joined[-1][2]:
+                chrom, start, end, value = joined[-1]
+                joined[-1] = (chrom, start, max(end, hit[2]), max(value, hit[3]))
+            else:
+                joined.append(hit)
+        self.kept = joined
+        return done
+
+    def flush(self):
+        done, self.kept = sorted(self.kept, key=lambda x: x[1]), []
+        return done
+
+
+def windowed_search(fasta, size, overlap, graph_options, search_options, processes=1, stats=None):
+    """
+    Searches windows of records with their local graphs, so that memory
+    is bounded by the size of window instead of length of record.
+    With more processes, at most 2 windows per process are in flight.
+    """
+    merger = seam_merger()
+    if processes <= 1:
+        for window in windows(fasta, size, overlap):
+            yield from merger.add(*search_window(window, graph_options, search_options, stats))
+        yield from merger.flush()
+        return
+
+    # Importing multiprocessing slows down start of every run
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = deque()
+        for window in windows(fasta, size, overlap):
+            pending.append(pool.submit(search_window, window, graph_options, search_options))
+            if len(pending) >= 2 * processes:
+                yield from merger.add(*pending.popleft().result())
+        while pending:
+            yield from merger.add(*pending.popleft().result())
+    yield from merger.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='repeats',
+        description=HELP,
+    )
+
+    parser.add_argument('fasta_file', help='Fasta file or sequence store (seqstore.py) with sequences to search through')
+    parser.add_argument('-k', '--kmer_len', type=int, help='''Set length of k-meres''', default=20)
+    parser.add_argument('-t', '--abs-threshold', type=float, help='''Minimal number a k-mere has to be in the sequence to be considered to be searched for''', default=3)
+    parser.add_argument('-T', '--rel-threshold', type=float, help='''Only kmeres that are more frequent than REL_THRESHOLD * max frequency after rescaling''', default=0)
+    parser.add_argument('-S', '--scaling', type=str, help='''Add scaling of the frequences''', default='log1p', choices=rescale)
+
+    parser.add_argument('-m', '--max-drop', type=int, help='''Maximal drop in score to still count as one sequence''', default=200)
+    parser.add_argument('-i', '--insert-pen', type=float, help='''Penalty for insertion''', default=10)
+    parser.add_argument('-g', '--gap-pen', type=float, help='''Penalty for gap''', default=10)
+    parser.add_argument('-b', '--base-pen', type=float, help='''Penalty that is added in each step''', default=2)
+    parser.add_argument('-s', '--skip', type=int, help='''Skip first n bases of file''', default=0)
+    parser.add_argument('-e', '--exact-match', type=int, help='''Speed up the search by looking for exact matches of defined length at start of repetition''', default=7)
+    parser.add_argument('-W', '--window', type=int, help='''Search overlapping windows of WINDOW bases with their own graphs, bounds memory by window size''', default=0)
+    parser.add_argument('-O', '--overlap', type=int, help='''Overlap of windows, default is min(50000, WINDOW / 4)''')
+    parser.add_argument('-p', '--processes', type=int, help='''Number of windows searched concurrently, needs --window''', default=1)
+    parser.add_argument('--profile', type=str, help='''Count search statistics and timings of phases and write them into file PROFILE''')
+    parser.add_argument('--profiler', type=str, help='''Also profile the run and add the report to PROFILE file''', choices=['cprofile', 'sampling'])
+
+    args = parser.parse_args()
+
+    if args.profiler and not args.profile:
+        parser.error("--profiler needs --profile file for the report")
+    if args.overlap is None:
+        args.overlap = min(50000, args.window // 4)
+    if args.window and args.overlap >= args.window:
+        parser.error("--overlap has to be shorter than --window")
+    if args.processes > 1 and not args.window:
+        parser.error("--processes only parallelises windows, use with --window")
+    if args.window and args.skip:
+        parser.error("--skip can not be used with --window")
+    if args.profile and args.processes > 1:
+        parser.error("--profile only counts the main process, use -p 1")
+
+    fasta = args.fasta_file
+    k_len = args.kmer_len if args.kmer_len else 10
+
+    stats, profiler = None, nullcontext()
+    if args.profile:
+        from profiling import SearchStats, Profiler
+        stats = SearchStats()
+        if args.profiler:
+            profiler = Profiler(args.profiler)
+
+    graph_options = dict(
+        k=k_len,
+        scaling=args.scaling,
+        abs_threshold=args.abs_threshold,
+        rel_threshold=args.rel_threshold,
+        suffix=args.exact_match,
+    )
+    search_options = dict(
         MaxDrop=args.max_drop,
         InsertionPenalty=args.insert_pen,
         GapPenalty=args.gap_pen,
         BasePenalty=args.base_pen,
-        skip=args.skip,
-        exact_start=args.exact_match):
-    print(chrom, start, end, value)
+        exact_start=args.exact_match,
+    )
+
+    with profiler:
+        if args.window:
+            hits = windowed_search(fasta, args.window, args.overlap, graph_options, search_options,
+                                   processes=args.processes, stats=stats)
+        else:
+            graph = build_graph(fasta, stats=stats, **graph_options)
+            report_phase("# Searching for repeats", stats)
+            hits = repeats_search(fasta, graph, skip=args.skip, stats=stats, **search_options)
+
+        for chrom, start, end, value in hits:
+            print(chrom, start, end, value)
+
+    if stats is not None:
+        stats.phase(None)
+        with open(args.profile, 'w') as f:
+            f.write(stats.report())
+            if args.profiler:
+                f.write(profiler.report())
+
+
+if __name__ == '__main__':
+    main()
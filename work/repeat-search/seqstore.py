@@ -0,0 +1,206 @@
+#!/bin/python3.11
+
+import argparse
+import gzip
+import json
+import mmap
+import struct
+from itertools import groupby
+
+
+HELP="""
+Packed binary sequence store shared by the repeat-search tools.
+
+The FASTA file (plain or gzipped) is converted once into a store file which
+all tools may mmap read-only, so that the sequence is not parsed from text
+again by every stage and concurrent jobs share the page cache.
+
+Store layout:
+magic 'SQSTORE1' | uint64 index offset | uint64 index length | data | index
+
+Data holds one uint8 code per base (A=0, C=1, G=2, T=3), any other
+character (N, IUPAC codes) is masked as 4. Lowercase bases are stored
+as uppercase. Index is JSON with names, offsets and lengths of records,
+names are the full header lines without '>'. Records with duplicate names
+are all kept, lookup by name returns the first of them.
+
+read_records normalises FASTA files the same way, so the tools see the
+same sequence (and positions) whether they are given FASTA or store.
+
+Usage: seqstore convert file.fa[.gz] [-o file.sqs]
+       seqstore info file.sqs
+"""
+
+
+MAGIC = b'SQSTORE1'
+PREAMBLE = struct.Struct('<8sQQ')
+CHUNK = 1 << 20
+
+UNKNOWN = 4
+ENCODE = bytes(
+    {ord('A'): 0, ord('C'): 1, ord('G'): 2, ord('T'): 3,
+     ord('a'): 0, ord('c'): 1, ord('g'): 2, ord('t'): 3}.get(i, UNKNOWN)
+    for i in range(256))
+DECODE = bytes(b"ACGTN"[i] if i <= UNKNOWN else ord('N') for i in range(256))
+NORMALIZE = ENCODE.translate(DECODE)
+
+
+def open_text(file):
+    if file.endswith('.gz'):
+        return gzip.open(file, 'rt')
+    return open(file, 'r')
+
+
+def is_store(file):
+    try:
+        with open(file, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class SeqStore:
+    """
+    Read-only view of store file. Sequences are sliced directly from mmap.
+    """
+    def __init__(self, file):
+        self.file = file
+        with open(file, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_len = PREAMBLE.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise ValueError(f"File {file} is not a sequence store")
+        index = json.loads(self.mm[index_offset:index_offset+index_len])
+        self.names = index['names']
+        self.offsets = index['offsets']
+        self.lengths = index['lengths']
+        self.records = dict()
+        for idx, name in enumerate(self.names):
+            self.records.setdefault(name, idx)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self.mm.close()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        yield from self.names
+
+    def length(self, name):
+        return self.lengths[self.records[name]]
+
+    def codes(self, name, start=0, end=None, idx=None):
+        """
+        Returns uint8 codes of record as bytes.
+        Record is given by name or by its index idx.
+        """
+        if idx is None:
+            idx = self.records[name]
+        length = self.lengths[idx]
+        end = length if end is None else min(end, length)
+        offset = self.offsets[idx]
+        return self.mm[offset+start:offset+end]
+
+    def sequence(self, name, start=0, end=None, idx=None):
+        """
+        Returns record (or its part) as string of 'ACGTN'.
+        """
+        return self.codes(name, start, end, idx).translate(DECODE).decode('ascii')
+
+
+def convert(fasta, output):
+    """
+    Converts FASTA file (may be gzipped) into store file output.
+    """
+    names, offsets, lengths = [], [], []
+    with open_text(fasta) as fa, open(output, 'wb') as out:
+        out.write(PREAMBLE.pack(MAGIC, 0, 0))
+        position = PREAMBLE.size
+        for line in fa:
+            if line[0] == '>':
+                names.append(line[1:].rstrip('\r\n'))
+                offsets.append(position)
+                lengths.append(0)
+                continue
+            codes = line.rstrip('\r\n').encode('ascii').translate(ENCODE)
+            if not names:
+                names.append("")
+                offsets.append(position)
+                lengths.append(0)
+            out.write(codes)
+            lengths[-1] += len(codes)
+            position += len(codes)
+
+        index = json.dumps({'names': names, 'offsets': offsets, 'lengths': lengths}).encode()
+        out.write(index)
+        out.seek(0)
+        out.write(PREAMBLE.pack(MAGIC, position, len(index)))
+
+
+def _fasta_lines(fa):
+    record, seq_id = 0, ""
+    for line in fa:
+        if line[0] == '>':
+            record += 1
+            seq_id = line[1:].rstrip('\r\n')
+            yield record, seq_id, ""
+            continue
+        yield record, seq_id, line.rstrip('\r\n').encode('ascii').translate(NORMALIZE).decode('ascii')
+
+
+def read_records(file):
+    """
+    Generator of records from FASTA file or store file.
+
+    Yields tuples (sequence_id, chunks) where chunks iterates over parts
+    of the sequence as strings of 'ACGTN', lowercase bases are uppercased
+    and other characters are masked as N for both kinds of files.
+    As with itertools.groupby, chunks have to be consumed before advancing
+    to the next record.
+    """
+    if is_store(file):
+        with SeqStore(file) as store:
+            for idx, (name, length) in enumerate(zip(store.names, store.lengths)):
+                yield name, (store.sequence(name, start, start + CHUNK, idx)
+                             for start in range(0, length, CHUNK))
+        return
+
+    with open_text(file) as fa:
+        for (_, seq_id), lines in groupby(_fasta_lines(fa), key=lambda x: x[:2]):
+            yield seq_id, (line for _, _, line in lines if line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='seqstore',
+        description=HELP,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    conv = commands.add_parser('convert', help='Convert FASTA file into store')
+    conv.add_argument('fasta_file', help='FASTA file, may be gzipped')
+    conv.add_argument('-o', '--output', help='Output store file, default <fasta_file>.sqs')
+
+    info = commands.add_parser('info', help='Print records of store')
+    info.add_argument('store_file', help='Store file')
+
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        convert(args.fasta_file, args.output or args.fasta_file + '.sqs')
+    else:
+        with SeqStore(args.store_file) as store:
+            for name in store:
+                print(f"{name}\t{store.length(name)}")
+
+
+if __name__ == '__main__':
+    main()
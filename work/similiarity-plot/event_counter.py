@@ -1,39 +1,21 @@
 #!/bin/python3.11
 
 import argparse
-import matplotlib.pyplot as plt
-import matplotlib as mplot
-import numpy as np
-
-import tkinter as tk
-from tkinter import ttk
 
 
 HELP="""
 This script counts events (matches) in bedpe-file generated by ModDotPlot
 and creates a heatmap from them with specified window sizes.
+Alternatively it plots similarity matrix from kmer_similarity.py as heatmap.
 
 Heatmaps are always even-spaced, the window size is even over heatmap.
-"""
-
-parser = argparse.ArgumentParser(
-	prog='event-counter',
-	description=HELP,
-)
 
-parser.add_argument('bedpe_file', help='Bedpe file from ModDotPlot')
-parser.add_argument('-n', '--window-count', type=int, help=
-'''Generate <windows> windows, overwrites window-size setting
-Default: 20''')
-parser.add_argument('-w', '--window-size', type=int, help=
-'''Generate windows of size <window-size>''')
-parser.add_argument('-s', '--seq-names', type=str, help=
-'''Use lines in file <seq-names> instead of numbers as labels''')
-
-args = parser.parse_args()
+The script may also be imported, build_heatmap and matrix_parser create
+the heatmaps, plot_heatmap plots them. Matplotlib, numpy and tkinter
+are only imported once they are needed.
+"""
 
-bedpe = args.bedpe_file
-w_size = 1000
+MAX_ROWS = 20
 
 
 def bedpe_parser(bedpe: str, window_size: int = 1):
@@ -48,93 +30,178 @@ def bedpe_parser(bedpe: str, window_size: int = 1):
                     (int(line[5])-1)//window_size
 
 
-if bool(args.window_count) + bool(args.window_size) + bool(args.seq_names) > 1:
-    print("At most one of window count, size and sequences may be specified")
-    exit(1)
+def matrix_parser(matrix: str):
+    """
+    Reads similarity matrix from repeat-search/kmer_similarity.py,
+    labels are in the first row and column.
+    """
+    import numpy as np
 
+    with open(matrix, 'r') as f:
+        lines = [line.rstrip("\n").split("\t") for line in f if line.strip()]
+    labels = lines[0][1:]
+    return labels, np.array([list(map(float, line[1:])) for line in lines[1:]])
 
-# Compute window size
-if args.window_size:
-    w_size = args.window_size
-elif args.seq_names:
-    with open(args.seq_names, 'r') as f:
-        args.window_count = len(list(filter(lambda x: x, f.read().split("\n"))))
 
-if args.window_count:
-    max_idx = max(map(max, bedpe_parser(bedpe))) + 1
-    w_size = max_idx // args.window_count + 1
-print("WSize: ", w_size)
+def read_seq_names(seq_names: str):
+    with open(seq_names, 'r') as f:
+        return list(filter(lambda x: x, f.read().split("\n")))
 
 
-# Create heatmap
-heatdict = dict()
+def compute_window_size(bedpe: str, window_size=None, window_count=None):
+    """
+    Returns window size, window count overwrites window size setting.
+    """
+    if window_count:
+        max_idx = max(map(max, bedpe_parser(bedpe))) + 1
+        return max_idx // window_count + 1
+    if window_size:
+        return window_size
+    return 1000
 
-for i, j, k, l in bedpe_parser(bedpe, w_size):
-    for s in range(i, j+1):
-        for e in range(k, l+1):
-            heatdict[(s, e)] = heatdict.get((s, e), 0) + 1
 
-max_window = max(map(max, heatdict))
-heatmap = [[0 for _ in range(max_window + 1)] for _ in range(max_window + 1)]
-for i in range(max_window + 1):
-    for j in range(max_window + 1):
-        heatmap[i][j] = max(heatdict.get((i, j), 0), heatdict.get((j, i), 0))
-heatmap = np.array(heatmap, dtype=int) + 1
+def build_heatmap(bedpe: str, window_size: int = 1000, seq_names=None):
+    """
+    Counts events of bedpe file in windows of window_size.
+    Returns (labels, heatmap), heatmap is symmetric numpy array of counts + 1.
+    """
+    import numpy as np
 
-labels = list(map(str, range(1, max_window + 2)))
-if len(heatmap) == 23:
-    labels = list(map(lambda x: f"chr{x}", range(1, 23)))+['chrX', 'chrY']
-if args.seq_names:
-    with open(args.seq_names, 'r') as f:
-        labels = f.read().split("\n")
-        labels = list(filter(lambda x: x, labels))
+    heatdict = dict()
 
+    for i, j, k, l in bedpe_parser(bedpe, window_size):
+        for s in range(i, j+1):
+            for e in range(k, l+1):
+                heatdict[(s, e)] = heatdict.get((s, e), 0) + 1
 
-# Create plot using mathplotlib
-fig, axs = plt.subplots(1, 1)
-fig = plt.imshow(heatmap, cmap='hot', interpolation='nearest', norm=mplot.colors.LogNorm(vmin=heatmap.min(), vmax=heatmap.max()))
-plt.gca().invert_yaxis()
-axs.set_xticks(range(len(heatmap)))
-axs.set_yticks(range(len(heatmap)))
+    max_window = max(map(max, heatdict))
+    heatmap = [[0 for _ in range(max_window + 1)] for _ in range(max_window + 1)]
+    for i in range(max_window + 1):
+        for j in range(max_window + 1):
+            heatmap[i][j] = max(heatdict.get((i, j), 0), heatdict.get((j, i), 0))
+    heatmap = np.array(heatmap, dtype=int) + 1
 
-axs.set_xticklabels(labels, rotation=90)
-axs.set_yticklabels(labels)
-
-plt.show(block=False)
+    labels = list(map(str, range(1, max_window + 2)))
+    if len(heatmap) == 23:
+        labels = list(map(lambda x: f"chr{x}", range(1, 23)))+['chrX', 'chrY']
+    if seq_names:
+        labels = read_seq_names(seq_names)
+    return labels, heatmap
 
 
 def get(array, idxs):
     return [array[i] for i in idxs]
 
-def replot(indices):
-    idxs = [labels.index(ind) for ind, var in indices.items() if var.get()]
-    axs.cla()
-    data = heatmap[idxs, :][:, idxs]
-    axs.imshow(data, cmap='hot', interpolation='nearest', norm=mplot.colors.LogNorm(vmin=data.min(), vmax=data.max()))
-    axs.set_xticks(range(len(idxs)), get(labels, idxs))
-    axs.set_yticks(range(len(idxs)), get(labels, idxs))
-    axs.set_xticklabels(get(labels, idxs), rotation=90)
-    axs.invert_yaxis()
-    plt.draw()
-
 
-# Interactive matplotlib plot
-MAX_ROWS = 20
-
-root = tk.Tk()
+def draw(axs, heatmap, labels, log=True):
+    import matplotlib as mplot
 
-col = 0
-row = 0
-varray = dict([(label, tk.IntVar(root, value=1)) for label in labels])
-for label in labels:
-    checkbox = ttk.Checkbutton(root, text=label, variable=varray[label])
-    checkbox.grid(column=col, row=row)
-    row += 1
-    if row >= MAX_ROWS:
-        row = 0
-        col += 1
+    norm = mplot.colors.LogNorm if log else mplot.colors.Normalize
+    axs.imshow(heatmap, cmap='hot', interpolation='nearest', norm=norm(vmin=heatmap.min(), vmax=heatmap.max()))
+    axs.set_xticks(range(len(heatmap)))
+    axs.set_yticks(range(len(heatmap)))
+    axs.set_xticklabels(labels, rotation=90)
+    axs.set_yticklabels(labels)
+    axs.invert_yaxis()
 
-submit = ttk.Button(root, text="Plot", command=lambda: replot(varray))
-submit.grid(column=col, row=MAX_ROWS)
 
-root.mainloop()
+def plot_heatmap(heatmap, labels, log=True, output=None):
+    """
+    Plots heatmap with logarithmic (or linear) scale.
+    Saves it into output if specified, returns (figure, axes).
+    Saved figure is closed, so that pyplot does not keep it in a long
+    running process.
+    """
+    import matplotlib.pyplot as plt
+
+    fig, axs = plt.subplots(1, 1)
+    draw(axs, heatmap, labels, log)
+    if output:
+        fig.savefig(output, bbox_inches='tight')
+        plt.close(fig)
+    return fig, axs
+
+
+def interactive(heatmap, labels, log=True):
+    """
+    Shows heatmap together with window allowing for turning on/off sequences.
+    """
+    import matplotlib.pyplot as plt
+    import tkinter as tk
+    from tkinter import ttk
+
+    fig, axs = plot_heatmap(heatmap, labels, log)
+    plt.show(block=False)
+
+    def replot(indices):
+        idxs = [labels.index(ind) for ind, var in indices.items() if var.get()]
+        axs.cla()
+        draw(axs, heatmap[idxs, :][:, idxs], get(labels, idxs), log)
+        plt.draw()
+
+    root = tk.Tk()
+
+    col = 0
+    row = 0
+    varray = dict([(label, tk.IntVar(root, value=1)) for label in labels])
+    for label in labels:
+        checkbox = ttk.Checkbutton(root, text=label, variable=varray[label])
+        checkbox.grid(column=col, row=row)
+        row += 1
+        if row >= MAX_ROWS:
+            row = 0
+            col += 1
+
+    submit = ttk.Button(root, text="Plot", command=lambda: replot(varray))
+    submit.grid(column=col, row=MAX_ROWS)
+
+    root.mainloop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='event-counter',
+        description=HELP,
+    )
+
+    parser.add_argument('bedpe_file', help='Bedpe file from ModDotPlot')
+    parser.add_argument('-m', '--matrix', action='store_true', help=
+    '''Input file is a similarity matrix from repeat-search/kmer_similarity.py
+    instead of bedpe file, window options are ignored''')
+    parser.add_argument('-n', '--window-count', type=int, help=
+    '''Generate <windows> windows, overwrites window-size setting
+    Default: 20''')
+    parser.add_argument('-w', '--window-size', type=int, help=
+    '''Generate windows of size <window-size>''')
+    parser.add_argument('-s', '--seq-names', type=str, help=
+    '''Use lines in file <seq-names> instead of numbers as labels''')
+    parser.add_argument('-o', '--output', type=str, help=
+    '''Save the heatmap into file <output> instead of showing interactive plot''')
+
+    args = parser.parse_args()
+
+    bedpe = args.bedpe_file
+
+    if args.matrix:
+        labels, heatmap = matrix_parser(bedpe)
+    else:
+        if bool(args.window_count) + bool(args.window_size) + bool(args.seq_names) > 1:
+            print("At most one of window count, size and sequences may be specified")
+            exit(1)
+
+        window_count = args.window_count
+        if args.seq_names:
+            window_count = len(read_seq_names(args.seq_names))
+        w_size = compute_window_size(bedpe, args.window_size, window_count)
+        print("WSize: ", w_size)
+
+        labels, heatmap = build_heatmap(bedpe, w_size, args.seq_names)
+
+    if args.output:
+        plot_heatmap(heatmap, labels, not args.matrix, args.output)
+    else:
+        interactive(heatmap, labels, not args.matrix)
+
+
+if __name__ == '__main__':
+    main()